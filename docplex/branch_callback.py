@@ -9,12 +9,32 @@
 
 # This file shows how to connect CPLEX branch callbacks to a DOcplex model.
 import math
-import cplex
 import cplex.callbacks as cpx_cb
 
+import numpy as np
+
 from docplex.mp.callbacks.cb_mixin import *
 
-from collections import defaultdict
+def most_fractional(x, abs_obj, feas, infeas):
+    '''Return the index of the most fractional variable, or -1 if none.
+
+    X, ABS_OBJ and FEAS are the value, absolute-objective-coefficient
+    and feasibility arrays for all variables; INFEAS is the feasibility
+    status marking integer-infeasible variables. The scan runs entirely
+    in NumPy's compiled kernels; ties on fractionality are broken on the
+    largest absolute objective coefficient, then on the highest index.
+    '''
+    # Branchless distance to the nearest integer: equivalent to taking
+    # min(frac, 1 - frac) but with a single abs instead of a compare.
+    frac = x - np.floor(x)
+    frac = 0.5 - np.abs(frac - 0.5)
+    frac[feas != infeas] = -np.inf
+    # Two-level lexicographic max on (fractionality, |c_j|): frac is
+    # continuous, so it cannot be folded into a single scalar key with
+    # |c_j| without breaking its dominance.
+    bestj = int(np.lexsort((abs_obj, frac))[-1])
+    return bestj if frac[bestj] > -np.inf else -1
+
 
 class MyBranch(ModelCallbackMixin, cpx_cb.BranchCallback):
     '''Branch callback.
@@ -28,7 +48,20 @@ class MyBranch(ModelCallbackMixin, cpx_cb.BranchCallback):
         cpx_cb.BranchCallback.__init__(self, env)
         ModelCallbackMixin.__init__(self)
         self.nb_called = 0
-        self.stats = defaultdict(int)
+        # Branch counts indexed by variable index, allocated lazily on
+        # the first callback once the variable count is known.
+        self._counts = None
+        # Branching decisions are logged in memory and printed in bulk
+        # by report(), so the callback never blocks on I/O.
+        self._log = []
+        # Cache the constants used on every invocation so that the hot
+        # path does not repeat the attribute-chain lookups per node.
+        self._sos1 = self.branch_type.SOS1
+        self._sos2 = self.branch_type.SOS2
+        self._infeas = self.feasibility_status.infeasible
+        # Objective coefficients are constant during the search; cached
+        # on the first callback (the scoring only needs |c_j|).
+        self._obj_coefs = None
 
     def __call__(self):
         self.nb_called += 1
@@ -37,45 +70,32 @@ class MyBranch(ModelCallbackMixin, cpx_cb.BranchCallback):
         # If CPLEX plans to do an SOS branch then accept this decision.
         # Otherwise branch on the most fractional variable.
         br_type = self.get_branch_type()
-        if (br_type == self.branch_type.SOS1 or
-                br_type == self.branch_type.SOS2):
+        if br_type == self._sos1 or br_type == self._sos2:
             return
 
-        # Get solution at this node. In order to get the docplex variable
-        # object for a variable index you can use self.index_to_var, see below.
-        x = self.get_values()
+        # Get solution at this node, converting the lists returned by
+        # CPLEX into contiguous typed arrays so the scoring runs on
+        # float64/int32 buffers instead of boxed Python objects. To get
+        # the docplex variable object for a variable index you can use
+        # self.index_to_var, see report() below.
+        x = np.fromiter(self.get_values(), dtype=np.float64)
 
         objval = self.get_objective_value()
-        obj = self.get_objective_coefficients()
-        feas = self.get_feasibilities()
-
-        maxobj = -cplex.infinity
-        maxinf = -cplex.infinity
-        bestj = -1
-        infeas = self.feasibility_status.infeasible
+        if self._obj_coefs is None:
+            self._obj_coefs = np.abs(np.fromiter(
+                self.get_objective_coefficients(), dtype=np.float64))
+        feas = np.fromiter(self.get_feasibilities(), dtype=np.int32)
 
         # Find the most fractional variable
-        for j in range(len(x)):
-            if feas[j] == infeas:
-                xj_inf = x[j] - math.floor(x[j])
-                if xj_inf > 0.5:
-                    xj_inf = 1.0 - xj_inf
-
-                if (xj_inf >= maxinf and
-                        (xj_inf > maxinf or abs(obj[j]) >= maxobj)):
-                    bestj = j
-                    maxinf = xj_inf
-                    maxobj = abs(obj[j])
-
+        bestj = most_fractional(x, self._obj_coefs, feas, self._infeas)
         if bestj < 0:
             return
 
         xj_lo = math.floor(x[bestj])
-        dv = self.index_to_var(bestj)
-        self.stats[dv] += 1
-        # note that we convert the variable index to its docplex name
-        print('---> BRANCH[{0}]---  custom branch callback, branch type is {1}, var={2!s}'
-              .format(self.nb_called, self.brtype_map.get(br_type, '??'), dv))
+        if self._counts is None:
+            self._counts = np.zeros(len(x), dtype=np.int64)
+        self._counts[bestj] += 1
+        self._log.append((self.nb_called, br_type, bestj))
 
         # Create two new child nodes.
         # Note: the node_data argument can be any Python object or None.
@@ -88,16 +108,40 @@ class MyBranch(ModelCallbackMixin, cpx_cb.BranchCallback):
                          node_data=(bestj, xj_lo, "DOWN"))
 
     def report(self, n=5):
-        sorted_stats = sorted(self.stats.items(), key=lambda p: p[1], reverse=True)
-        for k, (dv, occ) in enumerate(sorted_stats[:n], start=1):
-            print('#{0} most branched: {1}, branched: {2}'.format(k, dv, occ))
+        # Flush the deferred branching log in one go.
+        # note that we convert the variable index to its docplex name
+        # only here, never on the branching hot path.
+        for nb, br_type, j in self._log:
+            print('---> BRANCH[{0}]---  custom branch callback, branch type is {1}, var={2!s}'
+                  .format(nb, self.brtype_map.get(br_type, '??'),
+                          self.index_to_var(j)))
+        del self._log[:]
+        if self._counts is None:
+            return
+        # Only resolve the docplex variable objects for the top-n
+        # indices reported here, never on the branching hot path.
+        n = min(n, len(self._counts))
+        top = np.argpartition(self._counts, -n)[-n:]
+        top = top[np.argsort(self._counts[top])[::-1]]
+        for k, j in enumerate(top, start=1):
+            occ = int(self._counts[j])
+            if occ == 0:
+                break
+            print('#{0} most branched: {1}, branched: {2}'
+                  .format(k, self.index_to_var(int(j)), occ))
 
 
 def add_branch_callback(docplex_model, logged=False):
     # register a class callback once!!!
     bcb = docplex_model.register_callback(MyBranch)
 
-    docplex_model.parameters.mip.interval = 1
+    # Per-node progress lines are only worth their cost when the log is
+    # shown; the display manager serializes with callback execution.
+    if logged:
+        docplex_model.parameters.mip.interval = 1
+    # CPLEX runs branch callbacks in deterministic serial mode anyway,
+    # so pin a single thread and skip the multi-thread setup.
+    docplex_model.parameters.threads = 1
     docplex_model.parameters.preprocessing.linear = 0
 
     solution = docplex_model.solve(log_output=logged)
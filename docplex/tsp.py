@@ -18,67 +18,112 @@
 
 import sys
 
+import numpy as np
+
+import cplex
 from cplex.callbacks import LazyConstraintCallback
 
 from docplex.mp.callbacks.cb_mixin import *
 from docplex.mp.model import Model
 
-def neighbors(node, sol, x, Edges):
-    """Get the neighbors of NODE in the current tour in SOL."""
-    return \
-        [e[1] for e in Edges if e[0] == node and sol.get_value(x[e]) > 0.5] + \
-        [e[0] for e in Edges if e[1] == node and sol.get_value(x[e]) > 0.5]
+def walk_tour(start, vals, adj):
+    """Return the tour through START as a list of nodes.
+
+    VALS is the array of all variable values, fetched in one bulk call,
+    indexed by variable index. ADJ is the precomputed adjacency list
+    mapping each node to the (neighbor, variable index) pairs of its
+    incident edges. The walk follows the active edges (value above 0.5)
+    from node to node until it returns to START, without materializing a
+    neighbor list per step.
+    """
+    tour = [start]
+    visited = {start}
+    node = start
+    while True:
+        succ = None
+        for k, vi in adj[node]:
+            if vals[vi] > 0.5 and k not in visited:
+                succ = k
+                break
+        # No unvisited active neighbor left: we are back at START.
+        if succ is None:
+            return tour
+        tour.append(succ)
+        visited.add(succ)
+        node = succ
+
+def separate(n, vals, x_index_of_edge, edge_col):
+    """Find all subtours of an integer solution over N cities.
+
+    VALS holds the variable values indexed by variable index,
+    X_INDEX_OF_EDGE maps each (i, j) edge to its variable index, and
+    EDGE_COL is the dense pair-to-column table. Returns a list of
+    (nodes, cols) pairs, one per subtour, where COLS are the column
+    indices of the subtour's edges; the list is empty when the solution
+    is a single tour. The whole separation sits behind this one call, so
+    a compiled implementation could replace it without touching the
+    callback.
+
+    At an integer solution the degree constraints hold, so the edges
+    with value 1 decompose the cities into disjoint cycles; these are
+    the connected components of a path-compressing union-find over the
+    active edges.
+    """
+    active = [e for e, vi in x_index_of_edge.items() if vals[vi] > 0.5]
+    parent = list(range(n))
+
+    def find(i):
+        root = i
+        while parent[root] != root:
+            root = parent[root]
+        # Path compression
+        while parent[i] != root:
+            parent[i], i = root, parent[i]
+        return root
+
+    for i, j in active:
+        parent[find(i)] = find(j)
+
+    components = {}
+    for i in range(n):
+        components.setdefault(find(i), []).append(i)
+    # A single component touching every city means there is no
+    # subtour to eliminate.
+    if len(components) < 2:
+        return []
+    # Group the active edges by component in one pass; both
+    # endpoints of an active edge share the same root.
+    component_cols = {}
+    for i, j in active:
+        component_cols.setdefault(find(i), []).append(edge_col[i][j])
+    return [(nodes, component_cols[root])
+            for root, nodes in components.items()]
+
 
 # Lazy constraint callback to separate subtour elimination constraints.
 class DOLazyCallback(ConstraintCallbackMixin, LazyConstraintCallback):
     def __init__(self, env):
         LazyConstraintCallback.__init__(self, env)
         ConstraintCallbackMixin.__init__(self)
+        # Separated subtours are logged in memory and printed after the
+        # solve, so the callback never blocks on I/O.
+        self._log = []
 
     def __call__(self):
-        # Fetch variable values into a solution object
-        sol = self.make_solution_from_vars(self.x.values())
-        visited = set()
-        for i in self.Cities:
-            if i in visited: continue
-            # Find the (sub)tour that includes city i
-            start = i
-            node = i
-            subtour = [-1] * n
-            size = 0
-            # Loop until we get back to start
-            nodes = list()
-            while node != start or size == 0:
-                visited.add(node)
-                nodes.append(node)
-                # Pick the neighbor that we did not yet visit on this (sub)tour
-                succ = None
-                for j in neighbors(node, sol, self.x, self.Edges):
-                    if j == start or j not in visited:
-                        succ = j
-                        break
-                # Move to the next neigbor
-                subtour[node] = succ
-                node = succ
-                size += 1
-            # If the tour does not touch every node then it is a subtour and
-            # needs to be eliminated
-            if size < self.n:
-                print('Violated subtour of length %d (%d) found: %s' %
-                      (size, n, ' - '.join([str(j) for j in nodes])))
-                # Create a constraint that states that from the variables in
-                # the subtour not all can be 1.
-                tour = 0
-                for j, k in enumerate(subtour):
-                    if k >= 0:
-                        tour += self.x[(min(j, k), max(j,k))]
-                ct = tour <= size - 1
-                unsats = self.get_cpx_unsatisfied_cts([ct], sol, tolerance=1e-6)
-                for ct, cpx_lhs, sense, cpx_rhs in unsats:
-                    print('Add violated subtour')
-                    self.add(cpx_lhs, sense, cpx_rhs)
-                # Stop separation, we separate only one subtour at a time.
-                break
+        # Fetch all variable values in one bulk call, hand them to the
+        # separator in a single call, and emit the cuts it returns.
+        vals = np.asarray(self.get_values(list(self.x_index_of_edge.values())))
+        for nodes, cols in separate(self.n, vals, self.x_index_of_edge,
+                                    self.edge_col):
+            size = len(nodes)
+            self._log.append((size, nodes))
+            # Create a constraint that states that from the variables in
+            # the subtour not all can be 1. The cut is always
+            # sum(x_e) <= size - 1, so emit it directly in CPLEX sparse
+            # form (the variable indices are the column indices) instead
+            # of building a docplex expression and converting it back.
+            lhs = cplex.SparsePair(ind=cols, val=[1.0] * len(cols))
+            self.add(constraint=lhs, sense='L', rhs=size - 1)
 
 
 # Get the problem data.
@@ -96,49 +141,67 @@ with open(sys.argv[1], 'r') as f:
             Edges = [(i, j) for i in Cities for j in Cities if i < j]
             print('n = %d' % n)
         elif line.startswith('dist = ['):
-            dist = {}
-            for e in Edges:
-                for line in f:
-                    dist[e] = int(line)
-                    break
+            # Read the whole distance block (one value per line, in the
+            # same order as Edges) in one vectorized call instead of one
+            # int() conversion per line in Python.
+            arr = np.loadtxt(f, dtype=np.int64, max_rows=len(Edges))
+            dist = dict(zip(Edges, arr.tolist()))
 
 # Set up the TSP model
 with Model(name = 'tsp') as m:
     x = m.binary_var_dict(Edges)
-    m.minimize(m.sum(dist[e] * x[e] for e in Edges))
+    # scal_prod builds the expression in one batch call instead of one
+    # intermediate expression per term.
+    m.minimize(m.scal_prod([x[e] for e in Edges], [dist[e] for e in Edges]))
+
+    # Precompute the adjacency list once so that neighbor lookups in the
+    # callback are O(deg) instead of scanning the full edge list. The
+    # adjacency stores variable indices so that values can be looked up
+    # in the array returned by one bulk get_values() call.
+    x_index_of_edge = {e: x[e].index for e in Edges}
+    adj = {j: [] for j in Cities}
+    # Dense symmetric table from a city pair to the column index of its
+    # edge variable: plain list indexing in the callback, no tuple
+    # allocation or hashing per edge.
+    edge_col = [[-1] * n for _ in Cities]
+    for (i, j), vi in x_index_of_edge.items():
+        adj[i].append((j, vi))
+        adj[j].append((i, vi))
+        edge_col[i][j] = vi
+        edge_col[j][i] = vi
+
+    # Group the variables of the edges incident to each city in one pass
+    # over the edge list, instead of rescanning it for every city.
+    incident = [[] for _ in Cities]
+    for e in Edges:
+        incident[e[0]].append(x[e])
+        incident[e[1]].append(x[e])
 
     # Each city is linked with two other cities
     for j in Cities:
-        m.add_constraint(sum(x[e] for e in Edges if e[0] == j) +
-                         sum(x[e] for e in Edges if e[1] == j) == 2)
+        m.add_constraint(m.sum_vars(incident[j]) == 2)
 
     # Register a lazy constraint callback
     cb = m.register_callback(DOLazyCallback)
-    # Store references to variables in callback instance so that we can use
-    # it for separation
+    # Store the problem size and the edge lookup tables in the callback
+    # instance so that we can use them for separation
     cb.n = n
-    cb.Edges = Edges
-    cb.Cities = Cities
-    cb.x = x
+    cb.x_index_of_edge = x_index_of_edge
+    cb.edge_col = edge_col
     m.lazy_callback = cb
 
     # Solve the model.
     m.solve(log_output = True)
 
+    # Print the subtours that were separated during the solve.
+    for size, nodes in cb._log:
+        print('Violated subtour of length %d (%d) found: %s' %
+              (size, n, ' - '.join([str(j) for j in nodes])))
+
     sol = m.solution
     print('Optimal tour has length %f' % sol.get_objective_value())
-    tour = list()
-    start = Cities[0]
-    node = start
-    visited = set()
-    while len(tour) == 0 or node is not start:
-        tour.append(node)
-        visited.add(node)
-        for j in neighbors(node, sol, x, Edges):
-            if j == start or j not in visited:
-                neighbor = j
-                break
-        node = neighbor
+    vals = np.asarray(sol.get_values([x[e] for e in Edges]))
+    tour = walk_tour(Cities[0], vals, adj)
     print('Optimal tour: %s' % ' - '.join([str(j) for j in tour]))
     assert len(tour) == n
 